@@ -1,25 +1,30 @@
 import re  # 添加此行以使用正則表達式
 import csv  # 添加此行以使用 csv.reader
+from pathlib import Path
 from typing import Tuple, Optional, Dict, Any
 import os
 import json
+import orjson  # 與 src/utils.py 相同，orjson 為必要依賴 (見 requirements.txt)
 import pandas as pd
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# 預先編譯正則表達式，避免每次呼叫都查詢 re 的快取
+_SPLIT_RE = re.compile(r'(\d+);(\d+)')
+_THINK_RE = re.compile(r'<think>.*?</think>', flags=re.IGNORECASE | re.DOTALL)
+
+# analyze_log_directory 回傳的欄位，main() 依此逐欄累積結果
+RESULT_COLUMNS = ("llm", "game", "role", "emotion", "num_samples", "metric_value", "metric_type")
 
 def parse_split_decision(decision_str: str) -> Tuple[Optional[float], Optional[float]]:
     """
     Parses 'number1;number2' for Dictator/Ultimatum Proposer.
     """
-    try:
-        # 使用正則表達式提取第一個 'num;num' 模式，避免重複字串干擾
-        match = re.search(r'(\d+);(\d+)', str(decision_str))
-        if match:
-            num1 = float(match.group(1))
-            num2 = float(match.group(2))
-            return num1, num2
-        return None
-    except (ValueError, AttributeError, TypeError):
-        return None
+    # 使用正則表達式提取第一個 'num;num' 模式，避免重複字串干擾
+    match = _SPLIT_RE.search(decision_str) if isinstance(decision_str, str) else None
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    return None, None
 
 def parse_responder_decision(decision_str: str) -> Optional[int]:
     """
@@ -29,7 +34,8 @@ def parse_responder_decision(decision_str: str) -> Optional[int]:
     if not isinstance(decision_str, str):
         return None
     
-    clean_decision = decision_str.strip().upper()
+    # 子字串比對不受前後空白影響，只需轉大寫
+    clean_decision = decision_str.upper()
     
     # Handle common variations found in logs
     if "ACCEPT" in clean_decision:
@@ -38,13 +44,20 @@ def parse_responder_decision(decision_str: str) -> Optional[int]:
         return 0
     return None
 
+
+def _load_json(path: str) -> Dict[str, Any]:
+    """
+    Reads a JSON file as bytes and parses it.
+    """
+    return orjson.loads(Path(path).read_bytes())
+
 def _strip_think_blocks(s: str) -> str:
     """
     Remove any <think>...</think> blocks (including multi-line) from a string.
     """
     if not isinstance(s, str):
         return s
-    return re.sub(r'<think>.*?</think>', '', s, flags=re.IGNORECASE | re.DOTALL)
+    return _THINK_RE.sub('', s)
 
 def analyze_log_directory(log_dir_path: str) -> Optional[Dict[str, Any]]:
     # --- File Paths ---
@@ -53,102 +66,106 @@ def analyze_log_directory(log_dir_path: str) -> Optional[Dict[str, Any]]:
     agent2_config_file = os.path.join(log_dir_path, 'agent2_config.json')
     game_config_file = os.path.join(log_dir_path, 'game_config.json')
 
-    if not all(os.path.exists(f) for f in [decisions_file, agent1_config_file, agent2_config_file, game_config_file]):
+    # 一次 scandir 取得目錄內容，取代逐一 os.path.exists 的 stat 呼叫
+    with os.scandir(log_dir_path) as it:
+        names = {entry.name for entry in it}
+    if not {'div_decisions.csv', 'agent1_config.json', 'agent2_config.json', 'game_config.json'}.issubset(names):
         return None
 
+    # 只有 I/O 與解析可能因資料損壞而失敗；其他例外代表程式錯誤，直接拋出
     try:
-        with open(agent1_config_file, 'r') as f: cfg1 = json.load(f)
-        with open(agent2_config_file, 'r') as f: cfg2 = json.load(f)
-        with open(game_config_file, 'r') as f: game_cfg = json.load(f)
-            
-        # --- Determine Role and Agent ---
-        is_responder_game = game_cfg.get("do_second_step", False) == True
-        
-        llm_agent_config = None
-        llm_decision_col = None
-        
-        if cfg1.get("agent_name") == "llm":
-            llm_agent_config = cfg1
-            llm_decision_col = 0 # agent1 is column 1 (0-indexed after timestamp)
-            # If LLM is Agent 1, usually Proposer
-        elif cfg2.get("agent_name") == "llm":
-            llm_agent_config = cfg2
-            llm_decision_col = 1 # agent2 is column 2
-            # If LLM is Agent 2, usually Responder in Ultimatum
-        else:
-            return None
+        cfg1 = _load_json(agent1_config_file)
+        cfg2 = _load_json(agent2_config_file)
+        game_cfg = _load_json(game_config_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error in {os.path.basename(log_dir_path)}: {e}")
+        return None
 
-        # Extract Emotion
-        has_emotion = llm_agent_config.get('has_emotion', False)
-        emotion_value = llm_agent_config.get('emotion_prompt_file', '')
-        emotion = emotion_value.split('/')[0] if (has_emotion and emotion_value) else "no_emotion"
-        
-        llm_name = llm_agent_config.get('llm_name')
-        game_name = game_cfg.get('name', 'unknown')
+    # --- Determine Role and Agent ---
+    is_responder_game = game_cfg.get("do_second_step", False) == True
+    
+    llm_agent_config = None
+    llm_decision_col = None
+    
+    if cfg1.get("agent_name") == "llm":
+        llm_agent_config = cfg1
+        llm_decision_col = 0 # agent1 is column 1 (0-indexed after timestamp)
+        # If LLM is Agent 1, usually Proposer
+    elif cfg2.get("agent_name") == "llm":
+        llm_agent_config = cfg2
+        llm_decision_col = 1 # agent2 is column 2
+        # If LLM is Agent 2, usually Responder in Ultimatum
+    else:
+        return None
+
+    # Extract Emotion
+    has_emotion = llm_agent_config.get('has_emotion', False)
+    emotion_value = llm_agent_config.get('emotion_prompt_file', '')
+    emotion = emotion_value.split('/')[0] if (has_emotion and emotion_value) else "no_emotion"
+    
+    llm_name = llm_agent_config.get('llm_name')
+    game_name = game_cfg.get('name', 'unknown')
 
-        # --- Load Data ---
-        # 使用 csv.reader 手動解析 CSV，以正確處理帶引號的多行字串
+    # --- Load Data ---
+    # 使用 csv.reader 手動解析 CSV，以正確處理帶引號的多行字串
+    try:
         with open(decisions_file, 'r') as f:
             reader = csv.reader(f)
             rows = list(reader)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        print(f"Error in {os.path.basename(log_dir_path)}: {e}")
+        return None
+    
+    if not rows:
+        return None
+    
+    # Assume first row is the decision row: timestamp, agent1_decision, agent2_decision
+    decision_row = rows[0]
+    if len(decision_row) < 3:
+        return None
+    
+    # 只清理 LLM 所在欄位的 <think>...</think>，不必處理 timestamp 與另一方的欄位
+    llm_decision = _strip_think_blocks(decision_row[llm_decision_col + 1])
+    
+    total_sum = float(game_cfg.get('total_sum', 1.0))
+    result_metrics = {
+        "llm": llm_name,
+        "game": game_name,
+        "role": "Unknown",
+        "emotion": emotion,
+        "num_samples": 1,  # Assuming one sample per log
+        "metric_value": 0.0,
+        "metric_type": "N/A"
+    }
+
+    # --- Logic Branch: Responder vs Proposer ---
+    
+    # Case 1: Ultimatum Responder (LLM is Agent 2 and do_second_step is True)
+    if game_name == "ultimatum" and is_responder_game and llm_decision_col == 1:
+        result_metrics["role"] = "Responder"
+        result_metrics["metric_type"] = "Accept Rate (%)"
         
-        if not rows:
+        # Parse as Boolean (1/0)
+        decision_parsed = parse_responder_decision(llm_decision)
+        if decision_parsed is not None:
+            result_metrics["metric_value"] = float(decision_parsed * 100)
+        else:
             return None
+    
+    # Case 2: Proposer / Dictator (Splitter)
+    else:
+        result_metrics["role"] = "Proposer"
+        result_metrics["metric_type"] = "Kept Share (%)"
         
-        # Strip <think>...</think> blocks from all fields in the first row
-        cleaned_row = [_strip_think_blocks(field) if field is not None else "" for field in rows[0]]
-        
-        # Assume first row is the decision row: timestamp, agent1_decision, agent2_decision
-        if len(cleaned_row) < 3:
+        # Parse as Split (Keep;Give)
+        split_parsed = parse_split_decision(llm_decision)
+        if split_parsed[0] is not None:
+            kept = split_parsed[0]
+            result_metrics["metric_value"] = (kept / total_sum) * 100
+        else:
             return None
         
-        agent1_decision = cleaned_row[1]
-        agent2_decision = cleaned_row[2]
-        
-        total_sum = float(game_cfg.get('total_sum', 1.0))
-        result_metrics = {
-            "llm": llm_name,
-            "game": game_name,
-            "role": "Unknown",
-            "emotion": emotion,
-            "num_samples": 1,  # Assuming one sample per log
-            "metric_value": 0.0,
-            "metric_type": "N/A"
-        }
-
-        # --- Logic Branch: Responder vs Proposer ---
-        
-        # Case 1: Ultimatum Responder (LLM is Agent 2 and do_second_step is True)
-        if game_name == "ultimatum" and is_responder_game and llm_decision_col == 1:
-            result_metrics["role"] = "Responder"
-            result_metrics["metric_type"] = "Accept Rate (%)"
-            
-            # Parse as Boolean (1/0)
-            decision_parsed = parse_responder_decision(agent2_decision)
-            if decision_parsed is not None:
-                result_metrics["metric_value"] = round(decision_parsed * 100, 2)
-            else:
-                return None
-        
-        # Case 2: Proposer / Dictator (Splitter)
-        else:
-            result_metrics["role"] = "Proposer"
-            result_metrics["metric_type"] = "Kept Share (%)"
-            
-            # Parse as Split (Keep;Give)
-            decision_to_parse = agent1_decision if llm_decision_col == 0 else agent2_decision
-            split_parsed = parse_split_decision(decision_to_parse)
-            if split_parsed and split_parsed[0] is not None:
-                kept = split_parsed[0]
-                result_metrics["metric_value"] = round((kept / total_sum) * 100, 2)
-            else:
-                return None
-            
-        return result_metrics
-
-    except Exception as e:
-        print(f"Error in {os.path.basename(log_dir_path)}: {e}")
-        return None
+    return result_metrics
 
 def main():
     parser = argparse.ArgumentParser()
@@ -159,43 +176,58 @@ def main():
         print(f"Error: {args.log_root} is not a directory.")
         return
 
-    all_results = []
+    # 以欄為單位累積結果，建立 DataFrame 時不需逐列統一 dict 的鍵
+    all_results = {column: [] for column in RESULT_COLUMNS}
     llm_order = []  # 記錄 LLM 出現順序
-    for dir_name in sorted(os.listdir(args.log_root)):
-        log_dir_path = os.path.join(args.log_root, dir_name)
-        if os.path.isdir(log_dir_path):
-            result = analyze_log_directory(log_dir_path)
-            if result:
-                all_results.append(result)
-                # 記錄 LLM 順序（避免重複）
-                if result['llm'] not in llm_order:
-                    llm_order.append(result['llm'])
-
-    if not all_results:
+    # os.scandir 的 DirEntry.is_dir() 直接使用目錄項目的類型資訊，不需額外 stat
+    with os.scandir(args.log_root) as it:
+        log_dirs = sorted((entry for entry in it if entry.is_dir()), key=lambda entry: entry.name)
+    log_dir_paths = [entry.path for entry in log_dirs]
+    if log_dir_paths:
+        # 各目錄彼此獨立，用多進程平行分析；map 保持輸入順序，LLM 出現順序不受影響
+        max_workers = min(os.cpu_count() or 1, len(log_dir_paths))
+        chunksize = max(1, len(log_dir_paths) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for result in executor.map(analyze_log_directory, log_dir_paths, chunksize=chunksize):
+                if result:
+                    for column in RESULT_COLUMNS:
+                        all_results[column].append(result[column])
+                    # 記錄 LLM 順序（避免重複）
+                    if result['llm'] not in llm_order:
+                        llm_order.append(result['llm'])
+
+    if not all_results["llm"]:
         print("No valid results found.")
         return
 
     df = pd.DataFrame(all_results)
+    # 低基數的字串欄位轉為 category，groupby 時以整數編碼分組
+    for column in ('llm', 'emotion', 'game', 'role'):
+        df[column] = df[column].astype('category')
     
+    # 一次 groupby 同時算出 Proposer 與 Responder 的平均，再以索引切片取出，避免布林遮罩複製整個 DataFrame
+    # 各目錄保留原始浮點數，平均後才統一四捨五入到小數點後兩位
+    grouped = df.groupby(['role', 'game', 'llm', 'emotion'], observed=True)['metric_value'].mean().round(2)
+    roles = grouped.index.unique(level='role')
+
     # Output 1: Proposer Stats
-    proposer_df = df[df['role'] == 'Proposer']
-    if not proposer_df.empty:
-        proposer_pivot = proposer_df.pivot_table(values='metric_value', index=['game', 'llm'], columns='emotion', aggfunc='mean')
+    if 'Proposer' in roles:
+        proposer_pivot = grouped.xs('Proposer', level='role').unstack('emotion')
         # 按 LLM 處理順序排序
         proposer_pivot = proposer_pivot.reindex(llm_order, level='llm')
         print("=== Proposer Behavior (Avg % Kept) ===")
         print(proposer_pivot)
-        proposer_pivot.to_csv('proposer_analysis.csv')
+        proposer_pivot.to_csv('proposer_analysis.csv', lineterminator='\n')
 
     # Output 2: Responder Stats
-    responder_df = df[df['role'] == 'Responder']
-    if not responder_df.empty:
-        responder_pivot = responder_df.pivot_table(values='metric_value', index=['llm'], columns='emotion', aggfunc='mean')
+    if 'Responder' in roles:
+        # Responder 只出現在 ultimatum，game 層只有單一值，可直接去掉
+        responder_pivot = grouped.xs('Responder', level='role').droplevel('game').unstack('emotion')
         # 按 LLM 處理順序排序
         responder_pivot = responder_pivot.reindex(llm_order)
         print("=== Responder Behavior (Accept Rate %) ===")
         print(responder_pivot)
-        responder_pivot.to_csv('responder_analysis.csv')
+        responder_pivot.to_csv('responder_analysis.csv', lineterminator='\n')
 
 if __name__ == "__main__":
     main()
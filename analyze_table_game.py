@@ -1,9 +1,25 @@
+import csv
 import pandas as pd
 import os
 import json
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from typing import Optional, Dict, Any
 
+import orjson  # 與 src/utils.py 相同，orjson 為必要依賴 (見 requirements.txt)
+
+def _load_json(path: str) -> Dict[str, Any]:
+    """
+    Reads a JSON file as bytes and parses it.
+    """
+    return orjson.loads(Path(path).read_bytes())
+
+COOPERATE_MOVE = "J"
+
+# analyze_log_directory 回傳的欄位，main() 依此逐欄累積結果
+RESULT_COLUMNS = ("llm", "emotion", "game", "rounds", "coop_rate")
+
 def analyze_log_directory(log_dir_path: str) -> Optional[Dict[str, Any]]:
     # --- File Paths ---
     decisions_file = os.path.join(log_dir_path, 'decisions.csv')
@@ -12,82 +28,78 @@ def analyze_log_directory(log_dir_path: str) -> Optional[Dict[str, Any]]:
     # [修改點 1] 改讀取 config.json
     config_file = os.path.join(log_dir_path, 'config.json')
 
-    # Debug: 檢查檔案是否存在
-    missing_files = []
-    if not os.path.exists(decisions_file): missing_files.append("decisions.csv")
-    if not os.path.exists(agent1_config_file): missing_files.append("agent1_config.json")
+    # Debug: 檢查檔案是否存在（一次 scandir 取得目錄內容，取代逐一 os.path.exists 的 stat 呼叫）
+    with os.scandir(log_dir_path) as it:
+        names = {entry.name for entry in it}
     # [修改點 2] 檢查 config.json
-    if not os.path.exists(config_file): missing_files.append("config.json")
+    missing_files = [name for name in ("decisions.csv", "agent1_config.json", "config.json") if name not in names]
     
     if missing_files:
         print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: Missing files -> {missing_files}")
         return None
 
+    # 只有 I/O 與解析可能因資料損壞而失敗；其他例外代表程式錯誤，直接拋出
     try:
-        with open(agent1_config_file, 'r') as f: cfg1 = json.load(f)
+        cfg1 = _load_json(agent1_config_file)
         
         # [修改點 3] 從 config.json 中讀取 game_config
-        with open(config_file, 'r') as f: full_config = json.load(f)
-        # 兼容性處理：有時候是直接存 game_config，有時候是包在裡面
-        game_cfg = full_config.get('game_config', full_config)
-        
-        llm_name = cfg1.get('llm_name', 'unknown')
-        has_emotion = cfg1.get('has_emotion', False)
-        emotion_full = cfg1.get('emotion', '')
-        
-        if has_emotion and emotion_full:
-            emotion = emotion_full.split('/')[0]
-        else:
-            emotion = "no_emotion"
-        if not emotion: emotion = "no_emotion"
-
-        # --- Load Data ---
-        try:
-            df = pd.read_csv(decisions_file, header=None)
-        except pd.errors.EmptyDataError:
-            print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: decisions.csv is completely empty.")
-            return None
-        except Exception as e:
-            print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: CSV read error ({e})")
-            return None
-
-        if df.empty: 
-            print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: DataFrame is empty.")
-            return None
-
-        if df.shape[1] < 2:
-            print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: CSV has too few columns ({df.shape[1]}). Expected >= 2.")
-            return None
-
-        agent1_moves = df.iloc[:, 1].astype(str).str.strip().str.upper()
-        total_rounds = len(agent1_moves)
-        
-        if total_rounds == 0: 
-            print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: No rounds found.")
-            return None
-
-        # 計算合作率 (模糊匹配 J)
-        COOPERATE_MOVE = "J"
-        coop_count = agent1_moves.apply(lambda x: COOPERATE_MOVE in x).sum()
-        coop_rate = (coop_count / total_rounds) * 100
-
-        print(f"   ✅ Processed {os.path.basename(log_dir_path)}: {total_rounds} rounds, Coop Rate={coop_rate:.1f}%")
-
-        return {
-            "llm": llm_name,
-            "emotion": emotion,
-            "game": game_cfg.get('name', 'prisoner_dilemma'),
-            "rounds": total_rounds,
-            "coop_rate": round(coop_rate, 2)
-        }
-
+        full_config = _load_json(config_file)
     except json.JSONDecodeError as e:
         print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: JSON Decode Error ({e})")
         return None
-    except Exception as e:
-        print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: Unexpected Error: {e}")
+    except OSError as e:
+        print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: Config read error ({e})")
+        return None
+
+    # 兼容性處理：有時候是直接存 game_config，有時候是包在裡面
+    game_cfg = full_config.get('game_config', full_config)
+    
+    llm_name = cfg1.get('llm_name', 'unknown')
+    has_emotion = cfg1.get('has_emotion', False)
+    emotion_full = cfg1.get('emotion', '')
+    
+    if has_emotion and emotion_full:
+        emotion = emotion_full.split('/')[0]
+    else:
+        emotion = "no_emotion"
+    if not emotion: emotion = "no_emotion"
+
+    # --- Load Data ---
+    # decisions.csv 只有少數幾列，直接用 csv.reader 讀取，省去建立 DataFrame 的開銷
+    try:
+        with open(decisions_file, 'r', newline='') as f:
+            rows = [row for row in csv.reader(f) if row]
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: CSV read error ({e})")
+        return None
+
+    if not rows:
+        print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: decisions.csv is completely empty.")
+        return None
+
+    n_columns = min(len(row) for row in rows)
+    if n_columns < 2:
+        print(f"   ⚠️  Skipping {os.path.basename(log_dir_path)}: CSV has too few columns ({n_columns}). Expected >= 2.")
         return None
 
+    # 合作判斷是子字串比對，不受前後空白影響，只需轉大寫
+    agent1_moves = [row[1].upper() for row in rows]
+    total_rounds = len(agent1_moves)
+
+    # 計算合作率 (模糊匹配 J)
+    coop_count = sum(COOPERATE_MOVE in move for move in agent1_moves)
+    coop_rate = (coop_count / total_rounds) * 100
+
+    print(f"   ✅ Processed {os.path.basename(log_dir_path)}: {total_rounds} rounds, Coop Rate={coop_rate:.1f}%")
+
+    return {
+        "llm": llm_name,
+        "emotion": emotion,
+        "game": game_cfg.get('name', 'prisoner_dilemma'),
+        "rounds": total_rounds,
+        "coop_rate": coop_rate
+    }
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("log_root", nargs='?', default="logs") 
@@ -97,46 +109,51 @@ def main():
         print(f"❌ Error: Log directory '{args.log_root}' not found.")
         return
 
-    all_results = []
+    # 以欄為單位累積結果，建立 DataFrame 時不需逐列統一 dict 的鍵
+    all_results = {column: [] for column in RESULT_COLUMNS}
     
     print(f"🔍 Scanning directory: {os.path.abspath(args.log_root)}")
     print("-" * 50)
 
-    items = sorted(os.listdir(args.log_root))
-    for dir_name in items:
-        if not dir_name.startswith("prisoner_dilemma"):
-            continue
-
-        full_dir_path = os.path.join(args.log_root, dir_name)
-        if os.path.isdir(full_dir_path):
-            res = analyze_log_directory(full_dir_path)
-            if res: 
-                all_results.append(res)
+    # os.scandir 的 DirEntry.is_dir() 直接使用目錄項目的類型資訊，不需額外 stat
+    with os.scandir(args.log_root) as it:
+        log_dirs = sorted(
+            (entry for entry in it if entry.name.startswith("prisoner_dilemma") and entry.is_dir()),
+            key=lambda entry: entry.name,
+        )
+    log_dir_paths = [entry.path for entry in log_dirs]
+    if log_dir_paths:
+        # 各目錄彼此獨立，用多進程平行分析；map 保持輸入順序
+        max_workers = min(os.cpu_count() or 1, len(log_dir_paths))
+        chunksize = max(1, len(log_dir_paths) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for res in executor.map(analyze_log_directory, log_dir_paths, chunksize=chunksize):
+                if res: 
+                    for column in RESULT_COLUMNS:
+                        all_results[column].append(res[column])
 
     print("-" * 50)
-    if not all_results:
+    if not all_results["llm"]:
         print("❌ No valid Prisoner's Dilemma results found.")
         return
 
     df = pd.DataFrame(all_results)
+    # 低基數的字串欄位轉為 category，groupby 時以整數編碼分組
+    for column in ('llm', 'game'):
+        df[column] = df[column].astype('category')
+    # emotion 的 category 順序即為輸出欄位順序：no_emotion 在最前，其餘依字母排序
+    emotion_order = sorted(set(all_results["emotion"]), key=lambda emotion: (emotion != 'no_emotion', emotion))
+    df['emotion'] = pd.Categorical(df['emotion'], categories=emotion_order, ordered=True)
     
     print("\n=== Analysis Result ===")
-    piv = df.pivot_table(
-        index=['llm'], 
-        columns='emotion', 
-        values='coop_rate', 
-        aggfunc='mean'
-    )
-    
-    cols = sorted(piv.columns.tolist())
-    if 'no_emotion' in cols:
-        cols.insert(0, cols.pop(cols.index('no_emotion')))
-    piv = piv[cols]
+    # 各目錄保留原始浮點數，平均後才統一四捨五入到小數點後兩位
+    piv = df.groupby(['llm', 'emotion'], observed=True)['coop_rate'].mean().unstack('emotion').round(2)
 
     print(piv.fillna("-"))
     
-    output_csv = os.path.join(args.log_root, '../prisoner_dilemma_analysis.csv')
-    piv.to_csv(output_csv)
+    # 寫到 log_root 的上一層目錄（先正規化路徑，不保留 '../'）
+    output_csv = os.path.join(os.path.dirname(os.path.abspath(args.log_root)), 'prisoner_dilemma_analysis.csv')
+    piv.to_csv(output_csv, lineterminator='\n')
     print(f"\n💾 Analysis saved to: {output_csv}")
 
 if __name__ == "__main__":
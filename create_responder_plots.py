@@ -1,26 +1,31 @@
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # non-interactive backend: plots are only saved to files
 import matplotlib.pyplot as plt
 import os
 from datetime import datetime
 
-def abbreviate_llm(llm_name):
+def abbreviate_llm_series(llm_names):
     """
-    Abbreviate LLM name for display, e.g., 'mistral.mistral-7b-instruct-v0:2' -> 'mistral-7b-instruct'
+    Abbreviate a Series of LLM names for display, e.g., 'mistral.mistral-7b-instruct-v0:2' -> 'mistral-mistral-7b-instruct'
     """
     # Remove prefixes like 'us.' or 'amazon.'
-    parts = llm_name.replace('us.', '').replace('amazon.', '').split('.')
-    if len(parts) >= 2:
-        company = parts[0]
-        model = parts[1].split('-')[0] + '-' + '-'.join(parts[1].split('-')[1:3])  # e.g., mistral-7b-instruct
-        return f"{company}-{model}"
-    return llm_name  # Fallback
+    names = llm_names.str.replace('us.', '', regex=False).str.replace('amazon.', '', regex=False)
+    parts = names.str.split('.')
+    company = parts.str[0]
+    model_parts = parts.str[1].str.split('-')
+    # first dash-separated token plus up to the next two, e.g., mistral-7b-instruct
+    model = (model_parts.str[0] + '-' + model_parts.str[1].fillna('')
+             + ('-' + model_parts.str[2]).fillna(''))
+    # Fallback to the raw name when there is no '.'-separated model part
+    return (company + '-' + model).fillna(llm_names)
 
 def create_plots(csv_path):
     # Load data
     df = pd.read_csv(csv_path)
     
     # Abbreviate LLM names
-    df['llm_abbrev'] = df['llm'].apply(abbreviate_llm)
+    df['llm_abbrev'] = abbreviate_llm_series(df['llm'])
     
     # Timestamp for filenames
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -28,42 +33,31 @@ def create_plots(csv_path):
     # Colors
     colors = {'anger': 'red', 'happiness': 'green', 'no_emotion': 'blue'}
     
-    # Plot 1: Anger
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.bar(df['llm_abbrev'], df['anger'], color=colors['anger'])
-    ax.set_xlabel('LLM Model')
-    ax.set_ylabel('Anger Value (%)')
-    ax.set_title('Responder Anger Behavior')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    fig.savefig(f'responder_anger_{timestamp}.png')
-    plt.close(fig)
+    # X-axis ticks shared by all plots
+    labels = df['llm_abbrev'].tolist()
+    x = range(len(labels))
     
-    # Plot 2: Happiness
+    # Plots 1-3: one bar chart per emotion
+    single_plots = [
+        ('anger', 'Anger Value (%)', 'Responder Anger Behavior', 'responder_anger'),
+        ('happiness', 'Happiness Value (%)', 'Responder Happiness Behavior', 'responder_happiness'),
+        ('no_emotion', 'No Emotion Value (%)', 'Responder No Emotion Behavior', 'responder_no_emotion'),
+    ]
+    # A single figure is reused for every plot; the axes are cleared between saves
     fig, ax = plt.subplots(figsize=(12, 6))
-    ax.bar(df['llm_abbrev'], df['happiness'], color=colors['happiness'])
-    ax.set_xlabel('LLM Model')
-    ax.set_ylabel('Happiness Value (%)')
-    ax.set_title('Responder Happiness Behavior')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    fig.savefig(f'responder_happiness_{timestamp}.png')
-    plt.close(fig)
-    
-    # Plot 3: No Emotion
-    fig, ax = plt.subplots(figsize=(12, 6))
-    ax.bar(df['llm_abbrev'], df['no_emotion'], color=colors['no_emotion'])
-    ax.set_xlabel('LLM Model')
-    ax.set_ylabel('No Emotion Value (%)')
-    ax.set_title('Responder No Emotion Behavior')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    fig.savefig(f'responder_no_emotion_{timestamp}.png')
-    plt.close(fig)
+    for column, ylabel, title, filename in single_plots:
+        ax.clear()
+        ax.bar(x, df[column], color=colors[column])
+        ax.set_xlabel('LLM Model')
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=45, ha='right')
+        fig.savefig(f'{filename}_{timestamp}.png', dpi=100, bbox_inches='tight')
     
     # Plot 4: Combination (side-by-side bars)
-    fig, ax = plt.subplots(figsize=(14, 6))
-    x = range(len(df))
+    fig.set_size_inches(14, 6)
+    ax.clear()
     width = 0.25
     ax.bar([i - width for i in x], df['anger'], width, label='Anger', color=colors['anger'])
     ax.bar(x, df['happiness'], width, label='Happiness', color=colors['happiness'])
@@ -72,10 +66,9 @@ def create_plots(csv_path):
     ax.set_ylabel('Value (%)')
     ax.set_title('Responder Combination Behavior')
     ax.set_xticks(x)
-    ax.set_xticklabels(df['llm_abbrev'], rotation=45, ha='right')
+    ax.set_xticklabels(labels, rotation=45, ha='right')
     ax.legend()
-    plt.tight_layout()
-    fig.savefig(f'responder_combination_{timestamp}.png')
+    fig.savefig(f'responder_combination_{timestamp}.png', dpi=100, bbox_inches='tight')
     plt.close(fig)
 
 if __name__ == "__main__":
@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 from tqdm import tqdm
 
 from src.agent.init_agent import init_agent
@@ -12,22 +10,19 @@ from src.utils import (
     print_config, read_text,
 )
 import argparse
-import pickle
+import hashlib
+import json
+import os
+import sys
+import threading
 import time  # 添加此行以使用 time.sleep
+from concurrent.futures import ThreadPoolExecutor
 
 # The new get_bedrock_client in utils.py will handle credentials.
 # No need to load .env or initialize the client here.
 
 
-# Removed caching logic as it's not needed for simplified, fresh runs.
-
-
-def generate_emotions(possible_emotions, possible_prompts):
-    res = []
-    for emotion in possible_emotions:
-        for prompt_file in possible_prompts:
-            res.append(f'{emotion}/{prompt_file}')
-    return res
+# 已完成的 config 會在 logs/.done 留下標記，中斷後重跑只會補跑未完成的部分；刪除該目錄即可全部重跑。
 
 
 # --- START MODIFIED PARAMETERS FOR REPRESENTATIVE SAMPLING ---
@@ -62,13 +57,23 @@ possible_emotions = ["anger", "happiness"]
 # 4. 簡化情境提示 (Prompts)：僅包含 ["simple"]
 possible_prompts = ["simple"]
 
-emotions = generate_emotions(possible_emotions, possible_prompts)
+emotions = [(emotion, prompt_file) for emotion in possible_emotions for prompt_file in possible_prompts]
+# config['emotion'] 存的是 prompt 路徑 "emotion/prompt_file"；反查表讓主迴圈直接取得兩個部分，不用再 split
+emotion_parts = {f'{emotion}/{prompt_file}': (emotion, prompt_file) for emotion, prompt_file in emotions}
+emotion_parts[''] = ('no_emotion', '')
 do_scratchpad_steps = [True, False] # 保持不變，因為這會影響模型行為
 
 
 # 5. 聚焦關鍵分配比例 (Split Ratios)：[0.2]
 predefined_split_ratios = [0.2] 
 
+# 已完成實驗的標記目錄：每個完成的 config 留下一個以雜湊命名的空檔案，重跑時跳過
+DONE_PATH = LOG_PATH / '.done'
+
+# 7. 並行設定：Bedrock 呼叫是網路 I/O，用執行緒並行；每個模型另外限制同時進行的實驗數以免超過配額
+max_workers = 8
+max_concurrent_per_model = 2
+
 # --- END MODIFIED PARAMETERS FOR REPRESENTATIVE SAMPLING ---
 
 
@@ -93,31 +98,22 @@ def generate_name_configs():
 
 
 def generate_agent_configs():
-    cur_agent_basic_config = deepcopy(agent_basic_config)
-    agent_configs = []
-    for llm in llms:
-        cur_agent_basic_config['llm_name'] = llm
-        for do_scratchpad_step in do_scratchpad_steps:
-            cur_agent_basic_config['do_scratchpad_step'] = do_scratchpad_step
-            cur_agent_basic_config['has_emotion'] = True
-            for emotion in emotions:
-                cur_agent_basic_config['emotion'] = emotion
-                agent_configs.append(deepcopy(cur_agent_basic_config))
-            cur_agent_basic_config['has_emotion'] = False
-            cur_agent_basic_config['emotion'] = ''
-            agent_configs.append(deepcopy(cur_agent_basic_config))
-    return agent_configs
+    # config 的值都是不可變的基本型別，直接用 dict 字面值建立，不需要 deepcopy
+    # 每種情緒一組，最後加上無情緒 (has_emotion=False, emotion='') 的對照組
+    emotion_settings = [(True, f'{emotion}/{prompt_file}') for emotion, prompt_file in emotions] + [(False, '')]
+    return [
+        {**agent_basic_config, 'llm_name': llm, 'do_scratchpad_step': do_scratchpad_step,
+         'has_emotion': has_emotion, 'emotion': emotion}
+        for llm in llms
+        for do_scratchpad_step in do_scratchpad_steps
+        for has_emotion, emotion in emotion_settings
+    ]
 
 
 def generate_predefined_agent_configs():
-    res = []
-    for ratio in predefined_split_ratios:
-        cur_config = deepcopy(agent_basic_config)
-        cur_config['agent_name'] = 'ratio_division'
-        cur_config['summary_step'] = 'summary_step1'
-        cur_config['ratio'] = ratio
-        res.append(cur_config)
-    return res
+    # memory_update_addintional_keys 在各 config 間共用同一個 dict，下游只讀取不修改
+    return [{**agent_basic_config, 'agent_name': 'ratio_division', 'summary_step': 'summary_step1', 'ratio': ratio}
+            for ratio in predefined_split_ratios]
 
 def run_game(game_config, naming_config, agent1_config, agent2_config, logger):
     game = DivisionGame(
@@ -139,10 +135,14 @@ def run_game(game_config, naming_config, agent1_config, agent2_config, logger):
         }
     )
 
-    game.run(agent1, agent2, logger)
+    try:
+        return game.run(agent1, agent2, logger)
+    finally:
+        # 關閉 logger 讓 CSV 緩衝寫回磁碟，之後的統計/分析才讀得到完整內容
+        logger.close()
 
 
-def run_pipeline(game_basic_config, naming_config, agent1_basic_config, agent2_basic_config):
+def prepare_pipeline(game_basic_config, naming_config, agent1_basic_config, agent2_basic_config):
     game_config = prepare_division_game_config(game_basic_config)
     agent1_config = prepare_agent_config(
         config=agent1_basic_config,
@@ -156,37 +156,81 @@ def run_pipeline(game_basic_config, naming_config, agent1_basic_config, agent2_b
         naming_config=naming_config,
         agent_ind=2,
     )
+    return game_config, naming_config, agent1_config, agent2_config
 
+
+def run_pipeline(game_config, naming_config, agent1_config, agent2_config):
+    """Run and log one game; returns True only if every decision was a valid model response."""
     logger = TwoAgentsLogger.construct_from_configs(
-        agent1_config, agent2_config, LOG_PATH, game_name=game_basic_config['name']
+        agent1_config, agent2_config, LOG_PATH, game_name=game_config['name']
     )
-    if args.verbose:
-        print_config(game_config)
-        print("==================")
-        print_config(agent1_config)
-        print("==================")
-        print_config(agent2_config)
-        raise Exception()
-
-    run_game(game_config, naming_config, agent1_config, agent2_config, logger)
+    success = run_game(game_config, naming_config, agent1_config, agent2_config, logger)
 
     save_readable_config(game_config, logger.run_name, LOG_PATH)
     save_readable_config(agent1_config, logger.run_name, LOG_PATH)
     save_readable_config(agent2_config, logger.run_name, LOG_PATH)
 
     time.sleep(1)  # 添加此行：在每個 run_pipeline 後休息 1 秒，以避免 AWS Bedrock API 速率限制
+    return success
+
+
+def print_pipeline_configs(game_config, naming_config, agent1_config, agent2_config):
+    print_config(game_config)
+    print("==================")
+    print_config(agent1_config)
+    print("==================")
+    print_config(agent2_config)
+
+
+def config_hash(cur_config):
+    return hashlib.blake2b(json.dumps(cur_config, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def read_done_hashes():
+    os.makedirs(DONE_PATH, exist_ok=True)
+    return set(os.listdir(DONE_PATH))
+
+
+def task_order(task):
+    # 同一模型、同一情緒的實驗排在一起送出，共用的 prompt 前綴較容易命中 Bedrock 的 prompt cache
+    llm_name, _, (game_basic_config, _, agent1_basic_config, agent2_basic_config) = task
+    llm_agent_config = agent1_basic_config if agent1_basic_config['llm_name'] == llm_name else agent2_basic_config
+    return llm_name, llm_agent_config['emotion'], game_basic_config['name']
+
+
+def prepare_tasks(tasks):
+    """Turn (llm_name, config_hash, pipeline_args) tasks into (llm_name, config_hash, prepared_configs), in run order."""
+    # 第一階段：組 prompt 只是讀快取過的模板再 format，在主執行緒依序完成即可
+    # (多進程的啟動與 config pickle 成本反而比模板處理本身高)
+    return [(llm_name, done_hash, prepare_pipeline(*pipeline_args))
+            for llm_name, done_hash, pipeline_args in sorted(tasks, key=task_order)]
+
 
+def run_tasks(prepared_tasks):
+    """Run tasks from prepare_tasks on a thread pool, throttled per model."""
+    if not prepared_tasks:
+        return
+    model_semaphores = {llm_name: threading.Semaphore(max_concurrent_per_model) for llm_name, _, _ in prepared_tasks}
 
+    # 第二階段：受網路 I/O 主導的遊戲執行交給執行緒池
+    def run_task(task):
+        llm_name, done_hash, prepared_configs = task
+        with model_semaphores[llm_name]:
+            success = run_pipeline(*prepared_configs)
+        # 只有拿到有效決策才標記；API 錯誤或無法解析的 config 下次會重跑
+        if success:
+            (DONE_PATH / done_hash).touch()
 
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(prepared_tasks))) as ex:
+        list(tqdm(ex.map(run_task, prepared_tasks), total=len(prepared_tasks), desc='Running experiments'))
 
-parser = argparse.ArgumentParser(description='Run single experiment')
-parser.add_argument('--verbose', '-v', action='store_true', help="Enable verbose mode")
-args = parser.parse_args()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run single experiment')
+    parser.add_argument('--verbose', '-v', action='store_true', help="Print the first experiment's configs and exit")
+    args = parser.parse_args()
 
-    # cached_configs_1, cached_configs_2 = read_cached_configs()
-    cached_configs_1, cached_configs_2 = [], []
+    done_hashes = read_done_hashes()
 
     game_dictator_configs = generate_game_configs("dictator")
     game_ultimatum_configs = generate_game_configs("ultimatum")
@@ -200,55 +244,51 @@ if __name__ == "__main__":
 
     # ----dictator & ultimatum for 1st----
 
-    all_configs_1 = []
+    tasks_1 = []
 
     # 修改：移除 game_ultimatum_configs，只保留 game_dictator_configs（即 dictator proposer）
-    for game_basic_config in tqdm(game_dictator_configs, desc='Iterating GAME conf'):
+    for game_basic_config in game_dictator_configs:
         game_basic_config["do_second_step"] = False
-        for naming_config in tqdm(name_configs, desc='Iterating NAME conf'):
-            for cur_agent_basic_config in tqdm(agent_configs, desc='Iterating AGENT conf'):
-                cur_agent_basic_config1 = deepcopy(cur_agent_basic_config)
-                cur_agent_basic_config2 = deepcopy(cur_agent_basic_config)
-                cur_agent_basic_config1["summary_step"] = "summary_step1"
-                cur_agent_basic_config2["summary_step"] = "summary_step2"
-                #     configs.append((row.game_name, row.total_sum, row.coplayer, row.has_emotion, row.llm_name, row.emotion, row.emotion_prompt_file, row.do_scratchpad_step))
-                emotion_prompt_file_parts = cur_agent_basic_config1["emotion"].split('/')
-                if len(emotion_prompt_file_parts) != 2:
-                    if cur_agent_basic_config1["emotion"] != '':
-                        raise Exception()
-                    emotion_prompt_file_parts = ['no_emotion', '']
+        for naming_config in name_configs:
+            for cur_agent_basic_config in agent_configs:
+                cur_agent_basic_config1 = {**cur_agent_basic_config, "summary_step": "summary_step1"}
+                cur_agent_basic_config2 = {**cur_agent_basic_config, "summary_step": "summary_step2"}
+                emotion, emotion_prompt_file = emotion_parts[cur_agent_basic_config1["emotion"]]
                 cur_config = (
                     game_basic_config['name'],
                     game_basic_config['total_sum'],
                     naming_config['coplayer'],
                     cur_agent_basic_config1['has_emotion'],
                     cur_agent_basic_config1['llm_name'],
-                    emotion_prompt_file_parts[0],
-                    emotion_prompt_file_parts[1],
+                    emotion,
+                    emotion_prompt_file,
                     cur_agent_basic_config1['do_scratchpad_step']
                 )
-                # if cur_config not in cached_configs_1:
-                run_pipeline(game_basic_config, naming_config, cur_agent_basic_config1, cur_agent_basic_config2)
-                # run_pipeline(game_basic_config, naming_config, cur_agent_basic_config1, cur_agent_basic_config2)
+                done_hash = config_hash(cur_config)
+                if done_hash not in done_hashes:
+                    tasks_1.append((cur_agent_basic_config1['llm_name'], done_hash,
+                                    (game_basic_config, naming_config, cur_agent_basic_config1, cur_agent_basic_config2)))
+
+    prepared_tasks_1 = prepare_tasks(tasks_1)
+    if args.verbose and prepared_tasks_1:
+        # verbose 模式只印出第一組實驗的設定就結束，不建立 log 也不呼叫 Bedrock
+        print_pipeline_configs(*prepared_tasks_1[0][2])
+        sys.exit(0)
+    run_tasks(prepared_tasks_1)
 
     # ----ultimatum----
 
     print('ULTIMATUM 2')
-    all_configs_2 = []
+    tasks_2 = []
 
     # --2--
     # 保留：這部分是 ultimatum responder（第二階段，do_second_step = True）
-    for game_basic_config in tqdm(game_ultimatum_configs, desc='Iterating GAME conf'):
+    for game_basic_config in game_ultimatum_configs:
         game_basic_config["do_second_step"] = True
-        for naming_config in tqdm(name_configs, desc='Iterating NAME conf'):
-            for cur_agent_basic_config in tqdm(agent_configs, desc='Iterating AGENT conf'):
-                cur_agent_basic_config2 = deepcopy(cur_agent_basic_config)
-                cur_agent_basic_config2["summary_step"] = "summary_step2"
-                emotion_prompt_file_parts = cur_agent_basic_config2["emotion"].split('/')
-                if len(emotion_prompt_file_parts) != 2:
-                    if cur_agent_basic_config2["emotion"] != '':
-                        raise Exception()
-                    emotion_prompt_file_parts = ['no_emotion', '']
+        for naming_config in name_configs:
+            for cur_agent_basic_config in agent_configs:
+                cur_agent_basic_config2 = {**cur_agent_basic_config, "summary_step": "summary_step2"}
+                emotion, emotion_prompt_file = emotion_parts[cur_agent_basic_config2["emotion"]]
                 for predefined_agent_config in predefined_agent_configs:
                     cur_config = (
                         game_basic_config['name'],
@@ -256,17 +296,18 @@ if __name__ == "__main__":
                         naming_config['coplayer'],
                         cur_agent_basic_config2['has_emotion'],
                         cur_agent_basic_config2['llm_name'],
-                        emotion_prompt_file_parts[0],
-                        emotion_prompt_file_parts[1],
+                        emotion,
+                        emotion_prompt_file,
                         cur_agent_basic_config2['do_scratchpad_step'],
                         predefined_agent_config['ratio']
                     )
-                    all_configs_2.append(cur_config)
-                    # if cur_config not in cached_configs_2:
-                    run_pipeline(game_basic_config, naming_config, predefined_agent_config, cur_agent_basic_config2)
-    #
-    # with open('testing/possible_configs_1.pkl', 'wb') as f:
-    #     pickle.dump(all_configs_1, f)
-
-    # with open('testing/possible_configs_22.pkl', 'wb') as f:
-    #     pickle.dump(all_configs_2, f)
+                    done_hash = config_hash(cur_config)
+                    if done_hash not in done_hashes:
+                        tasks_2.append((cur_agent_basic_config2['llm_name'], done_hash,
+                                        (game_basic_config, naming_config, predefined_agent_config, cur_agent_basic_config2)))
+
+    prepared_tasks_2 = prepare_tasks(tasks_2)
+    if args.verbose and prepared_tasks_2:
+        print_pipeline_configs(*prepared_tasks_2[0][2])
+        sys.exit(0)
+    run_tasks(prepared_tasks_2)
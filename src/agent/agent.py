@@ -5,7 +5,8 @@ class BasicAgent:
     def init_memory(self):
         pass
 
-    def update_memory(self, my_step, opponent_step, my_reward, opponent_reward, step_num, **kwargs):
+    def update_memory(self, my_step, opponent_step, my_reward, opponent_reward, step_num,
+                      inner_emotion=None, outer_emotion=None, outer_opponent_emotion=None):
         pass
 
     def update_emotion_memory(self, emotion):
@@ -39,7 +39,8 @@ class VindictiveAgent(PDPredefinedAgent):
             return self.ego_move
         return self.coop_move
 
-    def update_memory(self, my_step, opponent_step, my_reward, opponent_reward, step_num, **kwargs):
+    def update_memory(self, my_step, opponent_step, my_reward, opponent_reward, step_num,
+                      inner_emotion=None, outer_emotion=None, outer_opponent_emotion=None):
         if opponent_step == self.ego_move:
             self.opponent_deflected = True
 
@@ -57,5 +58,6 @@ class ImitativeAgent(PDPredefinedAgent):
             return self.coop_move
         return self.last_opponent_step
 
-    def update_memory(self, my_step, opponent_step, my_reward, opponent_reward, step_num, **kwargs):
+    def update_memory(self, my_step, opponent_step, my_reward, opponent_reward, step_num,
+                      inner_emotion=None, outer_emotion=None, outer_opponent_emotion=None):
         self.last_opponent_step = opponent_step
@@ -1,5 +1,10 @@
 import re
 
+from src.utils import is_llm_error
+
+# 預先編譯，避免每次解析都查 re 模組的快取
+_ANSWER1_RE = re.compile(r'(\d+);(\d+)')
+
 class DivisionGame:
     def __init__(self, name, total_sum, do_second_step, coplayer_name):
         self.name = name
@@ -10,6 +15,7 @@ class DivisionGame:
 Do you accept the split?"""
 
     def run(self, agent1, agent2, logger):
+        """Play one division game; returns False when a decision is an API error or cannot be parsed."""
         agent1.init_memory()
         agent2.init_memory()
         agent1._round_question_format = agent1._round_question_format.format(total_sum=self.total_sum,
@@ -20,12 +26,15 @@ Do you accept the split?"""
         parsed_answer = self.parse_answer1(step1)
         if parsed_answer is None:
             print(f"⚠️  Warning: Could not parse Agent 1's decision. Raw response: '{step1}'")
-            logger.log({"div_decisions": {"agent1": f"PARSE_FAILED: {step1}", "agent2": ""}})
-            logger.log({"div_decisions_scratchpad": {"agent1": scratchpad_step1, "agent2": ""}})
-            return # Exit this specific game run gracefully
+            logger.log({
+                "div_decisions": {"agent1": f"PARSE_FAILED: {step1}", "agent2": ""},
+                "div_decisions_scratchpad": {"agent1": scratchpad_step1, "agent2": ""},
+            })
+            return False # Exit this specific game run gracefully
 
         agent1_sum_part, agent2_sum_part = parsed_answer
         step2, scratchpad_step2 = '', ''
+        success = not is_llm_error(step1)
 
         if self.name == 'ultimatum' and self.do_second_step:
             cur_update = self.update_format.format(coplayer=self.coplayer_name,
@@ -38,16 +47,23 @@ Do you accept the split?"""
                                                                                   give_sum=agent2_sum_part)
             agent2._add_to_history("user", cur_update)
             step2, scratchpad_step2 = self.check_for_scatchpad(agent2.make_step(""))
-            # We don't use the result of parse_answer2, so we just call it
-            self.parse_answer2(step2)
+            # 決策本身不使用 parse_answer2 的結果，只用來判斷回應是否有效
+            success = success and not is_llm_error(step2) and self.parse_answer2(step2) is not None
 
-        logger.log({"div_decisions": {"agent1": step1, "agent2": step2}})
-        logger.log({"div_decisions_scratchpad": {"agent1": scratchpad_step1, "agent2": scratchpad_step2}})
+        logger.log({
+            "div_decisions": {"agent1": step1, "agent2": step2},
+            "div_decisions_scratchpad": {"agent1": scratchpad_step1, "agent2": scratchpad_step2},
+        })
+        return success
 
     def parse_answer1(self, answer: str):
         """Robustly parses the answer to find a 'number;number' pattern."""
+        answer = str(answer)
+        # 沒有分號就不可能符合 "number;number"，省去 regex 搜尋
+        if ';' not in answer:
+            return None
         # Search for the pattern using regex
-        match = re.search(r'(\d+);(\d+)', str(answer))
+        match = _ANSWER1_RE.search(answer)
         
         if match:
             try:
@@ -62,19 +78,19 @@ Do you accept the split?"""
 
     def parse_answer2(self, answer: str):
         """Parses the 'ACCEPT' or 'REJECT' response."""
-        answer = str(answer).strip(' .,:\t\n$').upper()
+        if not isinstance(answer, str):
+            answer = str(answer)
+        # 子字串比對不受前後標點空白影響，不必先 strip，只需轉大寫
+        upper_answer = answer.upper()
 
-        if 'ACCEPT' in answer:
+        if 'ACCEPT' in upper_answer:
             return True
-        elif 'REJECT' in answer:
+        elif 'REJECT' in upper_answer:
             return False
         
         print(f"⚠️  Warning: Could not parse Agent 2's ACCEPT/REJECT decision. Raw response: '{answer}'")
         return None # Return None if parsing fails
 
     def check_for_scatchpad(self, step):
-        if isinstance(step, tuple):
-            step, scratchpad_step = step
-        else:
-            step, scratchpad_step = step, None
-        return step, scratchpad_step
+        # make_step 有 scratchpad 時回傳 (step, scratchpad)，否則只回傳 step
+        return step if isinstance(step, tuple) else (step, None)
@@ -1,5 +1,5 @@
 import pandas as pd
-from typing import List, Tuple, Dict
+from typing import Any, List, Optional, Tuple, Dict
 import os
 
 class BasicEvaluation:
@@ -13,7 +13,14 @@ class BasicEvaluation:
         logs (Dict[str, pd.DataFrame]): A dictionary mapping keys to their corresponding log dataframes.
     """
 
-    def __init__(self, keys: List[str], run_name: str, log_folder: str = '', header: int = None) -> None:
+    def __init__(
+        self,
+        keys: List[str],
+        run_name: str,
+        log_folder: str = '',
+        header: int = None,
+        read_csv_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> None:
         """
         Initializes a BasicEvaluation instance.
 
@@ -22,12 +29,17 @@ class BasicEvaluation:
             run_name (str): The name of the run for log files.
             log_folder (str): The folder where log files are located.
             header (int, optional): The row number to use as the column names. None means that the first row is not treated as a header.
+            read_csv_kwargs (Dict[str, Any], optional): Extra keyword arguments passed to pd.read_csv, e.g. usecols or dtype.
         """
         self.keys = keys
         self.run_name = run_name
         self.log_folder = log_folder
 
-        self.logs = {key: pd.read_csv(os.path.join(log_folder, run_name, f'{key}.csv'), header=header) for key in keys}
+        read_csv_kwargs = read_csv_kwargs or {}
+        self.logs = {
+            key: pd.read_csv(os.path.join(log_folder, run_name, f'{key}.csv'), header=header, **read_csv_kwargs)
+            for key in keys
+        }
 
     def get_metric(self) -> None:
         """
@@ -50,7 +62,13 @@ class DecisionStatistics(BasicEvaluation):
             run_name (str): The name of the run for log files.
             log_folder (str): The folder where log files are located.
         """
-        super().__init__([run_key], run_name, log_folder=log_folder)
+        # Only the two decision columns are needed: skip the timestamp column and dtype inference
+        super().__init__(
+            [run_key],
+            run_name,
+            log_folder=log_folder,
+            read_csv_kwargs={"usecols": [1, 2], "dtype": str, "engine": "c", "na_filter": False},
+        )
         self.run_key = run_key
 
     def get_metric(self) -> Tuple[pd.DataFrame, pd.Series]:
@@ -61,11 +79,11 @@ class DecisionStatistics(BasicEvaluation):
             Tuple[pd.DataFrame, pd.Series]: A dataframe of count statistics for each agent and a series of count combinations.
         """
         decision_log = self.logs[self.run_key]
-        count_1 = decision_log.iloc[:, 1].value_counts()
-        count_2 = decision_log.iloc[:, 2].value_counts()
+        count_1 = decision_log.iloc[:, 0].value_counts()
+        count_2 = decision_log.iloc[:, 1].value_counts()
         decision_stats = pd.DataFrame([count_1, count_2], index=['agent_1', 'agent_2'])
 
-        decision_log['combination'] = decision_log.iloc[:, 1] + decision_log.iloc[:, 2]
+        decision_log['combination'] = decision_log.iloc[:, 0] + decision_log.iloc[:, 1]
         count_combinations = decision_log['combination'].value_counts()
 
         return decision_stats, count_combinations
\ No newline at end of file
@@ -1,43 +1,67 @@
-from src.utils import EmotionBuffer, print_emotion_evolution
+from src.agent.llm_agent import LLMAgent
+from src.utils import EmotionBuffer, is_llm_error, print_emotion_evolution
 from tqdm import tqdm
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+# 每回合傳給 update_memory 的情緒欄位
+_EMO_KEYS = ("inner_emotion", "outer_emotion", "opponent_outer_emotion")
+
+
+def _neutral_emotion():
+    # 沒有情緒功能的 agent (例如 Rule-based) 一律視為 neutral
+    return "neutral"
 
 class TableGame:
     def __init__(self, reward_map):
         self.moves_to_rewards = reward_map
+        # 以 (agent1 動作, agent2 動作) tuple 為鍵，每回合查表時不需再串接字串
+        self._reward_table = {(k[0], k[1]): v for k, v in reward_map.items()}
         # 自動從獎勵表中解析出合法的動作 (例如 ['J', 'F'])
         # reward_map keys 像是 "JJ", "JF", "FJ", "FF"
         # 我們取 key 的第一個字元當作合法動作集合
-        self.valid_moves = list(set([k[0] for k in reward_map.keys()]))
+        # frozenset 讓 `in` 檢查為 O(1)
+        self.valid_moves = frozenset(k[0] for k in reward_map.keys())
+        # 所有動作合併成一個 alternation，一次掃描即可 (排序只為了 pattern 固定)
+        moves_alt = '|'.join(re.escape(move) for move in sorted(self.valid_moves))
+        self._move_word_re = re.compile(fr'\b({moves_alt})\b')
+        self._move_any_re = re.compile(f'({moves_alt})')
 
     def run(self, agent1, agent2, logger):
         pass
 
-    def parse_move(self, raw_step, valid_moves):
+    def parse_move(self, raw_step):
         """
-        強健的動作解析器：從 LLM 的廢話中提取出合法的單一字母動作。
+        強健的動作解析器：從 LLM 的廢話中提取出合法的單一字母動作 (以 self.valid_moves 為準)。
         """
-        if raw_step in valid_moves:
+        if raw_step in self.valid_moves:
             return raw_step
             
-        # 1. 嘗試轉大寫並去除空白
+        # API 錯誤訊息 (例如 "Error: API Call Failed") 不是模型的回答，不能靠放寬比對從中撈出動作字母
+        if is_llm_error(raw_step):
+            return None
+
+        # 1. 嘗試轉大寫並去除空白 (只做一次，後續檢查都重用 clean_step)
         clean_step = str(raw_step).strip().upper()
-        if clean_step in valid_moves:
+        if clean_step in self.valid_moves:
             return clean_step
+        # 單一字元且不是合法動作，下面的 regex/包含檢查也不可能找到
+        if len(clean_step) == 1:
+            return None
             
         # 2. 使用 Regex 尋找合法的動作字母 (例如 J 或 F)
         # 這會尋找字串中是否包含合法字母，並優先匹配獨立的字母
-        for move in valid_moves:
-            # 檢查是否有獨立的字母 (例如 "I choose J" 中的 J)
-            if re.search(fr'\b{move}\b', clean_step):
-                return move
+        # 檢查是否有獨立的字母 (例如 "I choose J" 中的 J)，取最先出現的那個
+        match = self._move_word_re.search(clean_step)
+        if match:
+            return match.group(1)
         
         # 3. 如果還是找不到，放寬檢查，只要字串包含該字母就接受
         # (風險：如果 valid_moves 是 C, D，且回答 "Choose", 則會誤判為 C)
         # 為了安全，這裡只在上面 Regex 失敗時才做簡單包含檢查
-        for move in valid_moves:
-            if move in clean_step:
-                return move
+        match = self._move_any_re.search(clean_step)
+        if match:
+            return match.group(1)
                 
         return None
 
@@ -63,78 +87,96 @@ class RepeatedTableGame(TableGame):
         agent1.init_memory()
         agent2.init_memory()
 
-        for step_num in range(self.n_steps): # tqdm(
-            self._run_step(agent1, agent2, step_num, logger)
+        # Agent 2 可能是 Rule-based agent，沒有情緒相關方法；每場遊戲檢查一次即可，不必每回合 hasattr
+        self._a2_has_inner = hasattr(agent2, 'get_inner_emotion')
+        self._a2_has_update_emotion = hasattr(agent2, 'update_emotion_memory')
+        self._a2_has_outer = hasattr(agent2, 'get_outer_emotion')
+        self._a2_has_update_mem = hasattr(agent2, 'update_memory')
+
+        # 兩個 agent 都是 LLM 時，同一回合內的呼叫互不相依 (狀態各自獨立)，Agent 2 的呼叫交給背景執行緒同時送出，等待時間減半；
+        # 對手是 Rule-based agent 時沒有第二個 Bedrock 呼叫可以重疊，直接在目前執行緒依序呼叫
+        pool = ThreadPoolExecutor(max_workers=1) if isinstance(agent1, LLMAgent) and isinstance(agent2, LLMAgent) else None
+        try:
+            for step_num in range(self.n_steps): # tqdm(
+                self._run_step(agent1, agent2, step_num, logger, pool)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    @staticmethod
+    def _call_pair(pool, call1, call2, *args):
+        if pool is None:
+            return call1(*args), call2(*args)
+        future2 = pool.submit(call2, *args)
+        return call1(*args), future2.result()
 
     def check_for_scatchpad(self, step):
-        if isinstance(step, tuple):
-            step, scratchpad_step = step
-        else:
-            step, scratchpad_step = step, None
-        return step, scratchpad_step
+        # make_step 有 scratchpad 時回傳 (step, scratchpad)，否則只回傳 step
+        return step if isinstance(step, tuple) else (step, None)
 
-    def _run_step(self, agent1, agent2, step_num, logger):
+    def _run_step(self, agent1, agent2, step_num, logger, pool):
         # make current step
-        raw_step1, scratchpad_step1 = self.check_for_scatchpad(agent1.make_step(step_num)) 
-        raw_step2, scratchpad_step2 = self.check_for_scatchpad(agent2.make_step(step_num))
+        made_step1, made_step2 = self._call_pair(pool, agent1.make_step, agent2.make_step, step_num)
+        raw_step1, scratchpad_step1 = self.check_for_scatchpad(made_step1)
+        raw_step2, scratchpad_step2 = self.check_for_scatchpad(made_step2)
         
         # --- 修改重點：加入解析邏輯 ---
-        step1 = self.parse_move(raw_step1, self.valid_moves)
-        step2 = self.parse_move(raw_step2, self.valid_moves)
+        step1 = self.parse_move(raw_step1)
+        step2 = self.parse_move(raw_step2)
         
-        # 防呆：如果解析失敗，記錄錯誤並使用預設值或跳過 (這裡選擇跳過並報錯)
-        if step1 is None:
-            print(f"⚠️ Agent 1 Move Parse Error: '{raw_step1}' not in {self.valid_moves}")
-            step1 = self.valid_moves[0] # Fallback: 隨機選一個以免程式崩潰，或者你可以選擇 return
-        if step2 is None:
-            print(f"⚠️ Agent 2 Move Parse Error: '{raw_step2}' not in {self.valid_moves}")
-            step2 = self.valid_moves[0]
+        # 防呆：解析失敗 (包含 API 錯誤回應) 的回合視為無效並跳過，不寫入 decisions 也不更新記憶
+        # 不以預設動作代替，否則每個失敗回合都會被算成同一種動作，使合作率產生偏差
+        if step1 is None or step2 is None:
+            if step1 is None:
+                print(f"⚠️ Agent 1 Move Parse Error: '{raw_step1}' not in {sorted(self.valid_moves)}")
+            if step2 is None:
+                print(f"⚠️ Agent 2 Move Parse Error: '{raw_step2}' not in {sorted(self.valid_moves)}")
+            print(f"⚠️ Skipping round {step_num}: no valid move to record")
+            return
         # ---------------------------
 
         try:
-            reward1, reward2 = self.moves_to_rewards[step1 + step2]
+            reward1, reward2 = self._reward_table[(step1, step2)]
         except KeyError as err:
             print(f"❌ Critical Logic Error: Combination '{step1+step2}' not found in reward map. Raw: {raw_step1}, {raw_step2}")
             return
             
-        logger.log({"decisions": {"agent1": step1, "agent2": step2}})
-        logger.log({"decisions_scratchpad": {"agent1": scratchpad_step1, "agent2": scratchpad_step2}})
-        
+        # 本回合要記錄的內容先收集起來，回合結束時一次交給 logger；
+        # 之後的情緒/記憶呼叫失敗時，finally 仍會先把已經決定的動作寫進 log
+        step_log = {
+            "decisions": {"agent1": step1, "agent2": step2},
+            "decisions_scratchpad": {"agent1": scratchpad_step1, "agent2": scratchpad_step2},
+        }
+        try:
+            self._reflect_and_update_memory(agent1, agent2, step1, step2, reward1, reward2, step_num, pool, step_log)
+        finally:
+            logger.log(step_log)
+
+    def _reflect_and_update_memory(self, agent1, agent2, step1, step2, reward1, reward2, step_num, pool, step_log):
         # reflect on self emotions
-        additional_args1 = dict.fromkeys(
-            ["inner_emotion", "outer_emotion", "opponent_outer_emotion"]
-        )
-        additional_args2 = dict.fromkeys(
-            ["inner_emotion", "outer_emotion", "opponent_outer_emotion"]
-        )
+        additional_args1 = dict.fromkeys(_EMO_KEYS)
+        additional_args2 = dict.fromkeys(_EMO_KEYS)
         if self.need_check_emotions:
-            inner_emotion1 = agent1.get_inner_emotion()
             # 檢查 Agent 2 是否有情緒功能 (如果是 Rule-based agent 可能沒有這個方法)
-            inner_emotion2 = agent2.get_inner_emotion() if hasattr(agent2, 'get_inner_emotion') else "neutral"
+            inner_emotion1, inner_emotion2 = self._call_pair(
+                pool, agent1.get_inner_emotion, agent2.get_inner_emotion if self._a2_has_inner else _neutral_emotion
+            )
             
             agent1.update_emotion_memory(inner_emotion1)
-            if hasattr(agent2, 'update_emotion_memory'):
+            if self._a2_has_update_emotion:
                 agent2.update_emotion_memory(inner_emotion2)
                 
             additional_args1["inner_emotion"] = inner_emotion1
             additional_args2["inner_emotion"] = inner_emotion2
-            logger.log(
-                {
-                    "inner_emotions": {
-                        "agent1": inner_emotion1,
-                        "agent2": inner_emotion2,
-                    }
-                }
-            )
+            step_log["inner_emotions"] = {"agent1": inner_emotion1, "agent2": inner_emotion2}
         # perceive and demonstrate emotions
         if self.need_demonstrate_emotions:
-            outer_emotion1 = agent1.get_outer_emotion()
-            outer_emotion2 = agent2.get_outer_emotion() if hasattr(agent2, 'get_outer_emotion') else "neutral"
+            outer_emotion1, outer_emotion2 = self._call_pair(
+                pool, agent1.get_outer_emotion, agent2.get_outer_emotion if self._a2_has_outer else _neutral_emotion
+            )
             # agent1.perceive_opponent_emotion(outer_emotion2)
             # agent2.perceive_opponent_emotion(outer_emotion1)
-            logger.log(
-                {"outer_emotions": {"agent1": outer_emotion1, "agent2": outer_emotion2}}
-            )
+            step_log["outer_emotions"] = {"agent1": outer_emotion1, "agent2": outer_emotion2}
             if self.memorize_demonstrated_emotions:
                 additional_args1["outer_emotion"] = outer_emotion1
                 additional_args2["outer_emotion"] = outer_emotion2
@@ -144,28 +186,29 @@ class RepeatedTableGame(TableGame):
                 
         # Update memory: reformatted according to memory_update.txt answer
         # (optional) + self emotions + seen emotions
+        # 情緒參數依 (inner_emotion, outer_emotion, outer_opponent_emotion) 順序以位置參數傳入
         memory_update1 = agent1.update_memory(
             step1,
             step2,
             reward1,
             reward2,
             step_num,
-            inner_emotion=additional_args1["inner_emotion"],
-            outer_emotion=additional_args1["outer_emotion"],
-            outer_opponent_emotion=additional_args2["opponent_outer_emotion"],
+            additional_args1["inner_emotion"],
+            additional_args1["outer_emotion"],
+            additional_args2["opponent_outer_emotion"],
         )
         
         # 針對 Agent 2 (如果是 Rule-based) 的相容性處理
-        if hasattr(agent2, 'update_memory'):
+        if self._a2_has_update_mem:
             memory_update2 = agent2.update_memory(
                 step2,
                 step1,
                 reward2,
                 reward1,
                 step_num,
-                inner_emotion=additional_args2["inner_emotion"],
-                outer_emotion=additional_args2["outer_emotion"],
-                outer_opponent_emotion=additional_args1["opponent_outer_emotion"],
+                additional_args2["inner_emotion"],
+                additional_args2["outer_emotion"],
+                additional_args1["opponent_outer_emotion"],
             )
         else:
             memory_update2 = "Rule-based Agent: No memory update"
@@ -173,4 +216,4 @@ class RepeatedTableGame(TableGame):
         # print(step1, step2)
         # print(f"agent1: {memory_update1}")
         # print(f"agent2: {memory_update2}")
-        logger.log({"memory": {"agent1": memory_update1, "agent2": memory_update2}})
+        step_log["memory"] = {"agent1": memory_update1, "agent2": memory_update2}
@@ -0,0 +1,258 @@
+import os
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+# 引用模組
+from src.agent.init_agent import init_agent
+from src.config_utils.table_utils import prepare_game_description, prepare_agent_config
+from src.dirs import LOG_PATH
+from src.game import RepeatedTableGame
+from src.evaluation import DecisionStatistics
+from src.utils import TwoAgentsLogger, save_readable_config
+
+# 從模型名稱提取簡短版本 (例如 "meta.llama3-8b-instruct-v1:0" -> "llama3-8b")：取最後一段，截到 -instruct / -v 為止
+_MODEL_SHORT_RE = re.compile(r'(?:.*\.)?(.*?)(?:-instruct|-v|$)')
+
+# ===========================
+# 1. 基礎設定 (Templates)
+# ===========================
+
+game_basic_config = {
+    "name": "prisoner_dilemma",
+    "n_steps": 5,  # 保持 5 回合以節省成本
+    "need_check_emotions": True,
+    "need_demonstrate_emotions": False,
+    "memorize_seen_emotions": False,
+    "memorize_demonstrated_emotions": False,
+}
+
+naming_config = {
+    "currency": "dollars",
+    "coplayer": "coplayer",
+    "move1": "J", # 合作
+    "move2": "F", # 背叛
+}
+
+# Agent 1 (LLM) - 預設值，稍後會在迴圈中被覆蓋
+agent1_basic_config = {
+    "agent_name": "emotion_reflection_llm",
+    "llm_name": "placeholder",
+    "has_emotion": False,
+    "emotion": "",
+    "do_scratchpad_step": False,
+    "memory_update_addintional_keys": {
+        'currency': naming_config["currency"]
+    },
+    "game_setting": {
+        "round_question": "round_question",
+        "general_template": "basic_template",
+        "environment": "experiment",
+        "emotions_info": "with_emotions_affect",
+        "final_instruction": "instruction",
+    },
+}
+
+# Agent 2 (Rule-based) - agent_name 由各個執行腳本決定 (alterating / imitative ...)
+agent2_basic_config = {
+    "agent_name": "alterating",
+    "llm_name": "rule_based",
+    "has_emotion": False,
+    "emotion": "none",
+    "memory_update_addintional_keys": {
+        'currency': naming_config["currency"]
+    },
+}
+
+# 你提供的模型列表 (請確保 AWS Bedrock 有開通這些模型的權限)
+default_llm_name_range = [
+    "mistral.mistral-7b-instruct-v0:2",      # Mistral 7B (開源/小型)
+    "mistral.mixtral-8x7b-instruct-v0:1",
+    "meta.llama3-8b-instruct-v1:0",       # Llama 3 8B (US Profile, 若上面那個失敗通常這個會成功)
+    "us.meta.llama3-1-70b-instruct-v1:0",
+    "amazon.titan-text-lite-v1",
+    "amazon.titan-text-express-v1",          # Amazon Titan (小型/閉源)
+    "openai.gpt-oss-20b-1:0", #
+    "openai.gpt-oss-120b-1:0",
+    "us.anthropic.claude-3-7-sonnet-20250219-v1:0",
+    "anthropic.claude-3-5-sonnet-20240620-v1:0",
+    "cohere.command-r-v1:0",          # Cohere Command R (不同架構)
+]
+
+experiments = [
+    ("anger/simple", True),
+    ("happiness/simple", True),
+    ("no_emotion", False)
+]
+
+# 同一模型同時進行的實驗數上限 (與 run_exps_division_game 相同)，避免同時打太多請求觸發 Bedrock 節流
+max_concurrent_per_model = 2
+
+# ===========================
+# 2. 執行邏輯
+# ===========================
+
+def run_game(game_config, naming_config, agent1_config, agent2_config, logger):
+    game = RepeatedTableGame(
+        reward_map=game_config["reward_map"],
+        n_steps=game_config["n_steps"],
+        need_check_emotions=game_config["need_check_emotions"],
+        need_demonstrate_emotions=game_config["need_demonstrate_emotions"],
+        memorize_demonstrated_emotions=game_config["memorize_demonstrated_emotions"],
+        memorize_seen_emotions=game_config["memorize_seen_emotions"],
+    )
+
+    agent1 = init_agent(agent1_config["agent_name"], agent1_config)
+    agent2 = init_agent(agent2_config["agent_name"], agent2_config)
+
+    full_config = {
+        "game_config": game_config,
+        "naming_config": naming_config,
+        "agent1_config": agent1_config,
+        "agent2_config": agent2_config
+    }
+    logger.log_json({"config": full_config})
+    # 兼容分析程式
+    logger.log_json({"agent1_config": agent1_config})
+
+    try:
+        game.run(agent1, agent2, logger)
+    finally:
+        # 關閉 logger 讓 CSV 緩衝寫回磁碟，之後的統計/分析才讀得到完整內容
+        logger.close()
+
+
+def prepare_agent1_config(target_llm, emotion_name, has_emotion_flag, final_game_config):
+    # 1. 設定 Agent 1：一次建出新的 dict；memory 的額外鍵另外複製，避免各實驗共用同一個可變 dict
+    current_agent1 = {
+        **agent1_basic_config,
+        "llm_name": target_llm,
+        "has_emotion": has_emotion_flag,
+        "emotion": emotion_name if has_emotion_flag else "",
+        "memory_update_addintional_keys": dict(agent1_basic_config["memory_update_addintional_keys"]),
+    }
+
+    # 2. 準備 Agent 1 (讀取 Prompt)
+    final_agent1_config = prepare_agent_config(
+        config=current_agent1,
+        game_name=final_game_config["name"],
+        naming_config=naming_config,
+        agent_ind=1,
+    )
+
+    # ======================================================
+    # [關鍵修正] 強制將 emotion 字串寫回設定檔，以免被 prepare 函式弄丟
+    # ======================================================
+    final_agent1_config["emotion"] = emotion_name if has_emotion_flag else ""
+    # ======================================================
+    return final_agent1_config
+
+
+def run_experiment(target_llm, model_short_name, emotion_name, has_emotion_flag, final_game_config, final_agent2_config):
+    """Run one (model, emotion) experiment end to end; each call owns its own logger directory."""
+    final_agent1_config = prepare_agent1_config(target_llm, emotion_name, has_emotion_flag, final_game_config)
+
+    # 3. 初始化 Logger
+    logger = TwoAgentsLogger.construct_from_configs(
+        final_agent1_config,
+        final_agent2_config,
+        LOG_PATH,
+        game_name=final_game_config['name'],
+        model_suffix=model_short_name
+    )
+
+    # 4. 執行遊戲
+    run_game(final_game_config, naming_config, final_agent1_config, final_agent2_config, logger)
+
+    # 5. 統計 (每個回合都解析失敗時沒有任何決策紀錄，無法統計)
+    if not os.path.exists(os.path.join(LOG_PATH, logger.run_name, 'decisions.csv')):
+        print(f"⚠️ No valid rounds recorded for {logger.run_name}; skipping statistics.")
+        return
+    evaluate_statistics = DecisionStatistics(logger.run_name, LOG_PATH)
+    decision_stats, count_combinations = evaluate_statistics.get_metric()
+
+    save_readable_config(
+        {"decision_stats": decision_stats, "count_combinations": count_combinations},
+        logger.run_name,
+        LOG_PATH,
+    )
+
+
+def print_dry_run(llm_name_range, final_game_config, final_agent2_config):
+    print(f"🔍 DRY RUN MODE")
+    print(f"Total Models: {len(llm_name_range)}")
+    print(f"Experiments per Model: {len(experiments)}")
+    print(f"Total Experiments: {len(llm_name_range) * len(experiments)}\n")
+
+    # 模擬第一組實驗的 config
+    test_emotion, test_has_emotion = experiments[0]
+    final_agent1_config = prepare_agent1_config(llm_name_range[0], test_emotion, test_has_emotion, final_game_config)
+
+    print("="*60)
+    print("First Experiment Config Preview:")
+    print("="*60)
+    print(f"Game: {final_game_config['name']}")
+    print(f"\n--- Agent 1 (LLM) ---")
+    print(f"  Model: {final_agent1_config['llm_name']}")
+    print(f"  Emotion: {final_agent1_config['emotion']}")
+    print(f"\n--- Agent 2 (Rule-based) ---")
+    print(f"  Name: {final_agent2_config['agent_name']}")
+    print(f"  Ego Move: {final_agent2_config.get('ego_move', 'N/A')}")
+    print(f"  Coop Move: {final_agent2_config.get('coop_move', 'N/A')}")
+    print("="*60)
+    print("\n✅ Dry run complete. Run without --dry-run to execute.")
+
+
+def run_table_game_core(llm_name_range, agent2_basic_config, dry_run=False):
+    """Run every emotion preset in `experiments` against each model in `llm_name_range`."""
+    # 檢查列表是否為空
+    if not llm_name_range:
+        print("⚠️  Warning: No models selected in 'llm_name_range'. Please uncomment at least one.")
+        return
+
+    # 遊戲設定與規則型 Agent 2 不隨模型/情緒改變，只準備一次
+    final_game_config = prepare_game_description(
+        config=game_basic_config,
+        naming_config=naming_config
+    )
+    final_agent2_config = prepare_agent_config(
+        config=agent2_basic_config,
+        game_name=final_game_config["name"],
+        naming_config=naming_config,
+        agent_ind=2,
+    )
+
+    if dry_run:
+        print_dry_run(llm_name_range, final_game_config, final_agent2_config)
+        return
+
+    print(f"📋 Total Models to Test: {len(llm_name_range)}")
+    print(f"📋 Total Emotions per Model: {len(experiments)}")
+    print("="*60)
+
+    # --- 外層迴圈：遍歷每個模型 ---
+    for model_idx, target_llm in enumerate(llm_name_range):
+        print(f"\n🚀 [{model_idx+1}/{len(llm_name_range)}] Starting Experiments for Model: {target_llm}")
+        model_short_name = _MODEL_SHORT_RE.match(target_llm).group(1)
+
+        # 加入 try-except，確保單一模型失敗不影響其他模型
+        try:
+            # --- 內層迴圈：遍歷每種情緒 ---
+            # 各情緒實驗互相獨立且受網路延遲主導，用執行緒並行 (模型依序執行，執行緒數即為每個模型的並行上限)；
+            # 使用 tqdm 顯示該模型的進度
+            with ThreadPoolExecutor(max_workers=min(max_concurrent_per_model, len(experiments))) as ex:
+                futures = [ex.submit(run_experiment, target_llm, model_short_name, emotion_name, has_emotion_flag,
+                                     final_game_config, final_agent2_config)
+                           for emotion_name, has_emotion_flag in experiments]
+                for future in tqdm(futures, desc=f"Testing {model_short_name}"):
+                    future.result()
+
+        except Exception as e:
+            print(f"\n❌ Critical Error with model {target_llm}: {str(e)}")
+            print("Skipping to next model...")
+            traceback.print_exc()
+
+    print("\n" + "="*60)
+    print("✅ All experiments finished!")
@@ -1,13 +1,32 @@
-import json
+import atexit
 import os
+import queue
+import random
 import sys
+import threading
+import time
 from collections import defaultdict
 import csv
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
 import boto3
-from botocore.exceptions import ClientError
+import orjson
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+# log/config 的 JSON 一律由 orjson 產生 (2 格縮排、UTF-8)，輸出格式不隨環境而變
+def _json_dumps(obj) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+_json_loads = orjson.loads
 
 # ==========================================
 # AWS Bedrock Client and Credentials Logic
@@ -21,6 +40,29 @@ AWS_REGION = "us-east-1"
 
 # Global boto3 client to be reused
 bedrock_client: Optional[boto3.client] = None
+# 連線池放大以配合多執行緒並行的實驗，保持 keep-alive 減少 TLS 握手；adaptive 模式會在被節流時由 client 端自動降速
+# 重試只由 _converse_with_retry 負責 (節流、5xx 與連線錯誤)，botocore 每次呼叫只送一次，避免兩層重試相乘
+BEDROCK_CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    retries={"total_max_attempts": 1, "mode": "adaptive"},
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=120,
+)
+# 整個程式共用一個 boto3 Session (與 client 一起在第一次使用時建立)
+bedrock_session: Optional[boto3.Session] = None
+
+# 實驗以多執行緒並行，第一次建立 client 時加鎖，避免同時建立多個 client (boto3 client 建立後可跨執行緒共用)
+_bedrock_client_lock = threading.Lock()
+
+# 支援 Converse API prompt caching 的模型 (以 model id 片段比對)；其他模型帶 cachePoint 會被拒絕
+PROMPT_CACHE_MODEL_MARKERS = (
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-3-5-haiku",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "amazon.nova-",
+)
 
 def get_bedrock_client() -> boto3.client:
     """
@@ -31,6 +73,14 @@ def get_bedrock_client() -> boto3.client:
     if bedrock_client is not None:
         return bedrock_client
 
+    with _bedrock_client_lock:
+        if bedrock_client is None:
+            bedrock_client = _create_bedrock_client()
+    return bedrock_client
+
+
+def _create_bedrock_client() -> boto3.client:
+    global bedrock_session
     # 1. 嘗試從環境變數取得 (最安全)
     access_key = os.environ.get("AWS_ACCESS_KEY_ID", AWS_ACCESS_KEY_FALLBACK)
     secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY", AWS_SECRET_KEY_FALLBACK)
@@ -40,13 +90,65 @@ def get_bedrock_client() -> boto3.client:
         sys.exit(1)
 
     print("🚀 Initializing AWS Bedrock client...")
-    bedrock_client = boto3.client(
-        service_name="bedrock-runtime",
+    bedrock_session = boto3.Session(
         region_name=AWS_REGION,
         aws_access_key_id=access_key,
         aws_secret_access_key=secret_key
     )
-    return bedrock_client
+    return bedrock_session.client(service_name="bedrock-runtime", config=BEDROCK_CLIENT_CONFIG)
+
+# 暫時性錯誤 (節流/服務端 5xx/模型未就緒或逾時/網路中斷) 以指數退避加隨機抖動重試，其餘錯誤直接拋出
+# botocore 本身不重試 (見 BEDROCK_CLIENT_CONFIG)，原本由它處理的連線錯誤與 5xx 也在這裡涵蓋
+RETRYABLE_ERROR_CODES = (
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ModelTimeoutException",
+    "InternalServerException",
+    "ModelNotReadyException",
+)
+RETRYABLE_CONNECTION_ERRORS = (
+    EndpointConnectionError,
+    ConnectTimeoutError,
+    ReadTimeoutError,
+    ConnectionClosedError,
+)
+MAX_CONVERSE_ATTEMPTS = 5
+
+def _converse_with_retry(client, **request):
+    for attempt in range(MAX_CONVERSE_ATTEMPTS):
+        try:
+            return client.converse(**request)
+        except ClientError as e:
+            error_code = e.response.get("Error", {}).get("Code", "")
+            status_code = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+            retryable = error_code in RETRYABLE_ERROR_CODES or status_code >= 500
+            if not retryable or attempt == MAX_CONVERSE_ATTEMPTS - 1:
+                raise
+        except RETRYABLE_CONNECTION_ERRORS as e:
+            if attempt == MAX_CONVERSE_ATTEMPTS - 1:
+                raise
+            error_code = type(e).__name__
+        delay = min(32, 2 ** attempt) + random.random()
+        print(f"⏳ {error_code} from {request.get('modelId')}, retrying in {delay:.1f}s...")
+        time.sleep(delay)
+
+_warned_llama31_models = set()
+
+# 已知不支援 system 參數的模型 (例如部分 Mistral)，之後直接走合併 prompt 的路徑，省去一次必定失敗的呼叫
+_models_without_system = set()
+
+def _converse_without_system(client, model_name, system_prompts, conversation, inf_config):
+    if system_prompts and conversation and conversation[0]['role'] == 'user':
+        all_sys_text = "\n".join(s['text'] for s in system_prompts)
+        full_first_message = f"System Instructions:\n{all_sys_text}\n\nUser Request:\n{conversation[0]['content'][0]['text']}"
+        conversation[0]['content'][0]['text'] = full_first_message
+
+    return _converse_with_retry(
+        client,
+        modelId=model_name,
+        messages=conversation,
+        inferenceConfig=inf_config
+    )
 
 def get_llm_response(model_name: str, messages: List[Dict[str, str]]) -> str:
     """
@@ -62,38 +164,46 @@ def get_llm_response(model_name: str, messages: List[Dict[str, str]]) -> str:
         for msg in messages if msg['role'] != 'system'
     ]
 
-    # Llama 3.1 check
-    if "llama3-1" in model_name and not model_name.startswith("us.") and AWS_REGION == "us-east-1":
+    # 遊戲描述/情緒設定放在 system，整場遊戲每一輪都相同，標記 cachePoint 讓 Bedrock 快取這段前綴
+    system_blocks = system_prompts
+    if system_prompts and any(marker in model_name for marker in PROMPT_CACHE_MODEL_MARKERS):
+        system_blocks = system_prompts + [{"cachePoint": {"type": "default"}}]
+
+    # Llama 3.1 check (每個模型只提醒一次)
+    if (model_name not in _warned_llama31_models and "llama3-1" in model_name
+            and not model_name.startswith("us.") and AWS_REGION == "us-east-1"):
+        _warned_llama31_models.add(model_name)
         print(f"⚠️  警告: 您可能需要為 {model_name} 使用 'us.' 前綴。")
 
     # 設定推論參數 (維持 512 以避免 Mistral/Llama 錯誤)
     inf_config = {"temperature": 0.0, "maxTokens": 1024}
 
+    skip_system = model_name in _models_without_system
     try:
-        # First attempt: Use 'system' parameter
-        response = client.converse(
-            modelId=model_name,
-            messages=conversation,
-            system=system_prompts,
-            inferenceConfig=inf_config
-        )
+        if skip_system:
+            response = _converse_without_system(client, model_name, system_prompts, conversation, inf_config)
+        else:
+            # First attempt: Use 'system' parameter
+            response = _converse_with_retry(
+                client,
+                modelId=model_name,
+                messages=conversation,
+                system=system_blocks,
+                inferenceConfig=inf_config
+            )
     except ClientError as e:
+        if skip_system:
+            print(f"🔴 AWS Bedrock Error on fallback: {e}")
+            return "Error: API Fallback Failed"
+
         err_msg = e.response.get("Error", {}).get("Message", "").lower()
         
         # Mistral Fallback Logic
         if "system" in err_msg and "support" in err_msg:
             # print(f"🔄 Model {model_name} does not support system prompts. Merging...") # Optional logging
-            if system_prompts and conversation and conversation[0]['role'] == 'user':
-                all_sys_text = "\n".join([s['text'] for s in system_prompts])
-                full_first_message = f"System Instructions:\n{all_sys_text}\n\nUser Request:\n{conversation[0]['content'][0]['text']}"
-                conversation[0]['content'][0]['text'] = full_first_message
-            
+            _models_without_system.add(model_name)
             try:
-                response = client.converse(
-                    modelId=model_name,
-                    messages=conversation,
-                    inferenceConfig=inf_config
-                )
+                response = _converse_without_system(client, model_name, system_prompts, conversation, inf_config)
             except ClientError as fallback_e:
                 print(f"🔴 AWS Bedrock Error on fallback: {fallback_e}")
                 return "Error: API Fallback Failed"
@@ -107,12 +217,14 @@ def get_llm_response(model_name: str, messages: List[Dict[str, str]]) -> str:
 
     # --- Parse Response (增強版) ---
     output_message = response.get('output', {}).get('message', {})
-    final_text = ""
+    # 先收集各區塊再一次 join，避免字串 += 反覆複製
+    parts = []
+    append = parts.append
     
-    for block in output_message.get('content', []):
+    for block in output_message.get('content', ()):
         # 1. 標準文字區塊
         if 'text' in block:
-            final_text += block['text']
+            append(block['text'])
         
         # 2. 推理內容區塊 (DeepSeek R1 / Nova 可能會用到)
         elif 'reasoningContent' in block:
@@ -120,10 +232,11 @@ def get_llm_response(model_name: str, messages: List[Dict[str, str]]) -> str:
             if 'reasoningText' in r_content:
                 # 將思考過程包在標籤中，或直接加入(視您的分析需求而定)
                 # 這裡我們選擇加入，以免回應為空
-                thought = r_content['reasoningText'].get('text', '')
-                final_text += f"<think>{thought}</think>\n"
+                append("<think>")
+                append(r_content['reasoningText'].get('text', ''))
+                append("</think>\n")
 
-    final_text = final_text.strip()
+    final_text = "".join(parts).strip()
 
     # --- 防呆機制：絕對不回傳空字串 ---
     if not final_text:
@@ -134,6 +247,10 @@ def get_llm_response(model_name: str, messages: List[Dict[str, str]]) -> str:
 
     return final_text
 
+def is_llm_error(response) -> bool:
+    # get_llm_response 不拋例外，失敗時回傳以 "Error: " 開頭的字串
+    return isinstance(response, str) and response.startswith("Error: ")
+
 # ==========================================
 # Original Utility Functions (Preserved)
 # ==========================================
@@ -168,16 +285,28 @@ class BasicLogger:
         self.logs_path: str = logs_path
 
         if run_name is None:
-            self.run_name = datetime.now().strftime("%d_%m_%H%M%S")
-            if game_name != '':
-                self.run_name = game_name + '_' + self.run_name
-            # 將模型名稱附加到資料夾名稱末端
-            if model_suffix != '':
-                self.run_name = self.run_name + '_' + model_suffix
+            self.run_name = self._claim_run_dir(logs_path, datetime.now().strftime("%d_%m_%H%M%S"), game_name, model_suffix)
         else:
             self.run_name = run_name
-
-        os.makedirs(os.path.join(logs_path, self.run_name), exist_ok=True)
+            os.makedirs(os.path.join(logs_path, self.run_name), exist_ok=True)
+
+    @staticmethod
+    def _claim_run_dir(logs_path: str, timestamp: str, game_name: str = '', model_suffix: str = '') -> str:
+        """Atomically create a fresh run directory; concurrent runs in the same second get a numeric suffix."""
+        attempt = 0
+        while True:
+            run_name = timestamp if attempt == 0 else f'{timestamp}_{attempt}'
+            if game_name:
+                run_name = game_name + '_' + run_name
+            # 將模型名稱附加到資料夾名稱末端
+            if model_suffix:
+                run_name = run_name + '_' + model_suffix
+            try:
+                # exist_ok=False 讓 makedirs 作為原子性的「佔用」動作，避免多執行緒寫進同一個資料夾
+                os.makedirs(os.path.join(logs_path, run_name))
+                return run_name
+            except FileExistsError:
+                attempt += 1
 
     def log_json(self, configs: Dict[str, Dict[str, any]]) -> None:
         for config_name, config in configs.items():
@@ -186,8 +315,8 @@ class BasicLogger:
     def _write_config_to_file(self, config: Dict[str, any], filename: str) -> None:
         file_path = os.path.join(self.logs_path, self.run_name, f"{filename}.json")
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w') as json_file:
-            json.dump(config, json_file, indent=4)
+        with open(file_path, 'wb') as json_file:
+            json_file.write(_json_dumps(config))
 
     @classmethod
     def construct_from_configs(
@@ -206,38 +335,124 @@ class BasicLogger:
     def log(self, values_dict: Dict[str, str], format='csv') -> None:
         pass
 
+    def close(self) -> None:
+        pass
+
 
 class TwoAgentsLogger(BasicLogger):
     def __init__(
         self, keys: List[str], logs_path: str = "", run_name: str = None, game_name: str = '', model_suffix: str = ''
     ) -> None:
         super().__init__(keys=keys, logs_path=logs_path, run_name=run_name, game_name=game_name, model_suffix=model_suffix)
-    
+        # 每個 key 的 CSV 在第一次寫入時開啟並保持開啟，直到 close()；避免每列都 open/close 一次
+        self._files: Dict[str, Any] = {}
+        self._writers: Dict[str, Any] = {}
+        # CSV 序列化與寫檔交給背景執行緒，遊戲迴圈只負責把列放進佇列；第一次 log() 時才啟動
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        # 背景執行緒寫檔失敗時記下例外，於下一次 log()/flush()/close() 在呼叫端拋出
+        self._error: Optional[Exception] = None
+        # 時間戳只到秒，同一秒內的多列共用同一個已格式化字串
+        self._last_ts_sec = -1
+        self._last_ts_str = ''
+
+    def _timestamp(self) -> str:
+        now = int(time.time())
+        if now != self._last_ts_sec:
+            self._last_ts_sec = now
+            self._last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        return self._last_ts_str
+
+    def _get_writer(self, key: str):
+        writer = self._writers.get(key)
+        if writer is None:
+            file_path = os.path.join(self.logs_path, self.run_name, f"{key}.csv")
+            self._files[key] = open(file_path, "a", newline="", buffering=1 << 16)
+            writer = self._writers[key] = csv.writer(self._files[key])
+        return writer
+
+    def _drain(self) -> None:
+        # 背景執行緒：依序寫出佇列中的列，收到 None 代表 close() 要求結束
+        while True:
+            rows = self._queue.get()
+            try:
+                if rows is None:
+                    return
+                # 已經寫檔失敗過就不再寫，但仍繼續取出佇列，讓 flush()/close() 的等待能結束
+                if self._error is None:
+                    for key, row in rows:
+                        self._get_writer(key).writerow(row)
+            except Exception as err:
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _raise_write_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
     def log(self, values_dict: Dict[str, Dict[str, str]]) -> None:
+        # 時間戳與格式檢查在呼叫當下完成，錯誤仍由呼叫端收到
+        timestamp = self._timestamp()
+        rows = []
         for key, agents in values_dict.items():
             if key in self.keys:
-                file_path = os.path.join(
-                    self.logs_path, self.run_name, f"{key}.csv"
-                )
-                with open(file_path, "a", newline="") as file:
-                    writer = csv.writer(file)
-                    if isinstance(agents, dict) and 'agent1' in agents and 'agent2' in agents:
-                        writer.writerow(
-                            [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), agents['agent1'], agents['agent2']]
-                        )
-                    else:
-                        raise ValueError(f'Value for key {key} must be a dictionary with "agent1" and "agent2"')
+                if isinstance(agents, dict) and 'agent1' in agents and 'agent2' in agents:
+                    rows.append((key, [timestamp, agents['agent1'], agents['agent2']]))
+                else:
+                    raise ValueError(f'Value for key {key} must be a dictionary with "agent1" and "agent2"')
             else:
                 raise ValueError(f'Uninitialized key: {key}')
 
+        self._raise_write_error()
+        if self._thread is None:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._drain, name=f'logger-{self.run_name}', daemon=True)
+            self._thread.start()
+            # 呼叫端忘了 close() 時，程式結束前仍會把佇列與緩衝寫回檔案
+            atexit.register(self.close)
+        self._queue.put(rows)
+
+    def flush(self) -> None:
+        """Block until every queued row has been written and flushed to disk."""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_write_error()
+        for file in self._files.values():
+            file.flush()
+
+    def close(self) -> None:
+        """Drain the queue, stop the writer thread and close the CSV files; logging again restarts them."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._queue = None
+        self._thread = None
+        for file in self._files.values():
+            try:
+                file.close()
+            except OSError as err:
+                # 關檔時寫回緩衝也可能失敗，其餘檔案仍要關閉
+                self._error = self._error or err
+        self._files.clear()
+        self._writers.clear()
+        atexit.unregister(self.close)
+        try:
+            self._raise_write_error()
+        finally:
+            self._error = None
+
 
 def print_emotion_evolution(emotion_buffer):
     pass
 
+@lru_cache(maxsize=None)
 def read_text(file_path):
+    # prompt 模板在每個實驗都會重複讀取，內容在執行期間不變，依路徑快取
     with open(file_path, "r", encoding="utf8") as f:
         return f.read()
 
 def read_json(file_path):
-    with open(file_path, "r", encoding="utf8") as f:
-        return json.load(f)
+    with open(file_path, "rb") as f:
+        return _json_loads(f.read())